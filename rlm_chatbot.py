@@ -12,13 +12,24 @@ No external APIs are required; the bot falls back to local heuristic search.
 from __future__ import annotations
 
 import argparse
+import hashlib
+import heapq
 import math
 import os
+import pickle
 import re
+import sys
 import textwrap
-from dataclasses import dataclass
+from array import array
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import suppress
+from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import repeat
 from pathlib import Path
-from typing import Iterable, List, Sequence
+from typing import Dict, Iterator, List, Sequence
 
 
 SUPPORTED_EXTENSIONS = {".md", ".txt", ".csv", ".py"}
@@ -30,6 +41,34 @@ DEFAULT_CONTEXT_FILES = [
     "Regular Expression (Regex) logic.txt",
     "RLM Scaffolding.py",
 ]
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "rlm_chatbot"
+
+# Bump when the chunking or index layout changes so stale caches are ignored.
+_INDEX_VERSION = 3
+# Cached index attributes and the type each must load as.
+_INDEX_FIELDS = {
+    "_sources": list,
+    "_indices": array,
+    "_texts": list,
+    "_rows": list,
+    "_postings": dict,
+}
+
+# Below this much raw text, worker start-up and pickling cost more than parallelism saves.
+_PARALLEL_MIN_BYTES = 4 * 1024 * 1024
+
+_NONSPACE_RE = re.compile(r"\S+")
+_WORD_RE = re.compile(r"[A-Za-z0-9]+")
+# Lowercases ASCII letters and digits and blanks out every other byte, including all bytes
+# of multi-byte UTF-8 sequences, for bytes.translate.
+_TOKEN_TABLE = bytes(
+    ord(chr(code).lower()) if code < 128 and chr(code).isalnum() else ord(" ")
+    for code in range(256)
+)
+_COMPLEX_RE = re.compile(r"why|how|compare|difference|justify", re.IGNORECASE)
+# Chunks are single-spaced, so a sentence break is exactly one space; nothing can backtrack.
+_SENT_RE = re.compile(r"(?<=[.!?]) ")
+_SENT_BYTES_RE = re.compile(rb"(?<=[.!?]) ")
 
 
 @dataclass(frozen=True)
@@ -44,117 +83,334 @@ class ChunkFinding:
     chunk: ContextChunk
     score: float
     snippets: List[str]
+    chunk_id: int = field(default=-1, repr=False, compare=False)
+
+
+def _tokenize(text: str) -> List[str]:
+    """Return the lowercased ASCII alphanumeric runs of ``text``."""
+    encoded = text.encode("utf-8", "surrogatepass")
+    return encoded.translate(_TOKEN_TABLE).decode("ascii").split()
+
+
+@lru_cache(maxsize=4096)
+def _tokenize_cached(text: str) -> tuple[str, ...]:
+    """Memoized ``_tokenize`` for query strings and snippets that recur across passes."""
+    return tuple(_tokenize(text))
+
+
+@lru_cache(maxsize=256)
+def _index_sentences(text: str) -> List[tuple[int, int, frozenset[str]]]:
+    """Return the (start, end, token set) span of each sentence in a chunk.
+
+    The chunk is translated into a token buffer once and each sentence's tokens are
+    split out of that buffer by offset, so no sentence of the chunk itself is copied.
+    """
+    encoded = text.encode("utf-8", "surrogatepass")
+    buffer = encoded.translate(_TOKEN_TABLE).decode("ascii")
+    starts = [0]
+    starts.extend(match.end() for match in _SENT_RE.finditer(text))
+    ends = starts[1:] + [len(text)]
+    if text.isascii():
+        byte_starts, byte_ends = starts, ends
+    else:
+        # Multi-byte characters shift the buffer's offsets away from the text's.
+        byte_starts = [0]
+        byte_starts.extend(match.end() for match in _SENT_BYTES_RE.finditer(encoded))
+        byte_ends = byte_starts[1:] + [len(encoded)]
+    return [
+        (start, end, frozenset(buffer[byte_start:byte_end].split()))
+        for start, end, byte_start, byte_end in zip(starts, ends, byte_starts, byte_ends)
+    ]
+
+
+@lru_cache(maxsize=1024)
+def _route_depth(query: str) -> int:
+    """Map a query's complexity to the number of recursive passes to run."""
+    tokens = _WORD_RE.findall(query)
+    complexity = len(tokens) + sum(1 for token in tokens if len(token) > 6)
+    if _COMPLEX_RE.search(query):
+        complexity += 8
+    if complexity <= 12:
+        return 1
+    if complexity <= 24:
+        return 2
+    return 3
+
+
+def _chunk_text(text: str, max_chunk_chars: int) -> Iterator[str]:
+    """Split a long document into chunks of whole, single-spaced words."""
+    words: List[str] = []
+    size = 0
+    for match in _NONSPACE_RE.finditer(text):
+        word = match.group()
+        if words and size + 1 + len(word) > max_chunk_chars:
+            yield " ".join(words)
+            words = []
+            size = 0
+        while len(word) > max_chunk_chars:
+            yield word[:max_chunk_chars]
+            word = word[max_chunk_chars:]
+        size += len(word) + 1 if words else len(word)
+        words.append(word)
+    if words:
+        yield " ".join(words)
+
+
+def _available_cpus() -> int:
+    """Return the number of CPUs this process may run on, honouring affinity masks."""
+    if hasattr(os, "process_cpu_count"):
+        return os.process_cpu_count() or 1
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def _load_and_chunk(path: Path, max_chunk_chars: int) -> List[tuple[str, Counter[str]]]:
+    """Read one context file and return its chunks paired with their term counts."""
+    raw_text = path.read_text(encoding="utf-8", errors="ignore")
+    return [
+        (text, Counter(_tokenize(text))) for text in _chunk_text(raw_text, max_chunk_chars)
+    ]
 
 
 class RLMChatBot:
     """A lightweight, offline Recursive Language Model chatbot."""
 
-    def __init__(self, context_files: Sequence[Path], max_chunk_chars: int = 1600):
+    def __init__(
+        self,
+        context_files: Sequence[Path],
+        max_chunk_chars: int = 1600,
+        cache_dir: Path | None = DEFAULT_CACHE_DIR,
+    ):
         self.context_files = context_files
         self.max_chunk_chars = max_chunk_chars
-        self.context_chunks: List[ContextChunk] = []
-        self._build_context()
+        self.cache_dir = cache_dir
+        # Chunk fields are parallel columns keyed by chunk id; scoring reads only the index.
+        self._sources: List[str] = []
+        self._indices = array("i")
+        self._texts: List[str] = []
+        # Sparse TF-IDF term-chunk matrix, held both by chunk (rows) and by term (postings).
+        self._rows: List[Dict[str, float]] = []
+        # Each term's postings are contiguous, parallel (chunk id, weight) arrays.
+        self._postings: Dict[str, tuple[array[int], array[float]]] = {}
+        if not self._load_index():
+            self._build_context()
+            self._save_index()
+
+    def _index_path(self) -> Path | None:
+        """Return the cache file for the current context files and chunk size."""
+        if self.cache_dir is None:
+            return None
+        stamps = []
+        for path in self.context_files:
+            if path.exists():
+                stat = path.stat()
+                stamps.append((str(path.resolve()), stat.st_mtime_ns, stat.st_size))
+        key = repr((_INDEX_VERSION, self.max_chunk_chars, stamps))
+        return self.cache_dir / f"{hashlib.sha256(key.encode()).hexdigest()}.pkl"
+
+    def _load_index(self) -> bool:
+        """Restore a previously built index from the cache, if one is present."""
+        path = self._index_path()
+        if path is None:
+            return False
+        try:
+            with path.open("rb") as handle:
+                state = pickle.load(handle)
+        except Exception:
+            # A corrupt or foreign cache file can fail in many ways; all of them mean rebuild.
+            return False
+        if not isinstance(state, dict):
+            return False
+        for name, kind in _INDEX_FIELDS.items():
+            if not isinstance(state.get(name), kind):
+                return False
+        columns = ("_sources", "_indices", "_texts", "_rows")
+        if len({len(state[name]) for name in columns}) != 1:
+            return False
+        for name in _INDEX_FIELDS:
+            setattr(self, name, state[name])
+        return True
+
+    def _save_index(self) -> None:
+        """Write the built index to the cache; failures only cost a rebuild next time."""
+        path = self._index_path()
+        if path is None:
+            return
+        state = {name: getattr(self, name) for name in _INDEX_FIELDS}
+        partial = path.with_suffix(f".{os.getpid()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with partial.open("wb") as handle:
+                pickle.dump(state, handle, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(partial, path)
+        except (OSError, pickle.PicklingError):
+            with suppress(OSError):
+                partial.unlink(missing_ok=True)
 
     def _build_context(self) -> None:
         """Load and chunk all context files into a searchable knowledge base."""
-        chunks: List[ContextChunk] = []
-        for path in self.context_files:
-            if not path.exists():
-                continue
-            raw_text = path.read_text(encoding="utf-8", errors="ignore")
-            for index, chunk in enumerate(self._chunk_text(raw_text)):
-                chunks.append(ContextChunk(source=path.name, index=index, text=chunk))
-        self.context_chunks = chunks
-
-    def _chunk_text(self, text: str) -> Iterable[str]:
-        """Split a long document into manageable chunks."""
-        normalized = re.sub(r"\s+", " ", text.strip())
-        if not normalized:
-            return []
-        chunks = []
-        start = 0
-        while start < len(normalized):
-            end = min(start + self.max_chunk_chars, len(normalized))
-            chunks.append(normalized[start:end])
-            start = end
-        return chunks
+        paths = [path for path in self.context_files if path.exists()]
+        loaded = self._load_parallel(paths)
+        if loaded is None:
+            loaded = list(map(_load_and_chunk, paths, repeat(self.max_chunk_chars)))
+        sources: List[str] = []
+        indices = array("i")
+        texts: List[str] = []
+        term_counts: List[Counter[str]] = []
+        for path, file_chunks in zip(paths, loaded):
+            for index, (text, counts) in enumerate(file_chunks):
+                sources.append(path.name)
+                indices.append(index)
+                texts.append(text)
+                term_counts.append(counts)
+        self._sources = sources
+        self._indices = indices
+        self._texts = texts
+        self._build_index(term_counts)
+
+    def _load_parallel(
+        self, paths: Sequence[Path]
+    ) -> List[List[tuple[str, Counter[str]]]] | None:
+        """Chunk files in worker processes, or return None when that would not pay off."""
+        workers = min(len(paths), _available_cpus())
+        if workers < 2 or sum(path.stat().st_size for path in paths) < _PARALLEL_MIN_BYTES:
+            return None
+        chunksize = max(1, len(paths) // (workers + 2))
+        limits = repeat(self.max_chunk_chars)
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                return list(executor.map(_load_and_chunk, paths, limits, chunksize=chunksize))
+        except (BrokenProcessPool, OSError):
+            # Sandboxes may forbid or kill worker processes; chunk in-process instead.
+            return None
+
+    def _build_index(self, term_counts: List[Counter[str]]) -> None:
+        """Build the sparse TF-IDF matrix, with IDF folded into its weights."""
+        df: Counter[str] = Counter()
+        for counts in term_counts:
+            df.update(counts.keys())
+        total = len(term_counts)
+        # Smoothed IDF keeps every indexed term positive, even in tiny corpora.
+        idf = {term: math.log((1 + total) / (1 + freq)) + 1.0 for term, freq in df.items()}
+        rows: List[Dict[str, float]] = []
+        postings: Dict[str, tuple[array[int], array[float]]] = {}
+        for cid, counts in enumerate(term_counts):
+            length = sum(counts.values())
+            row = {term: count / length * idf[term] for term, count in counts.items()}
+            for term, weight in row.items():
+                column = postings.get(term)
+                if column is None:
+                    column = postings[term] = (array("i"), array("d"))
+                column[0].append(cid)
+                column[1].append(weight)
+            rows.append(row)
+        self._rows = rows
+        self._postings = postings
 
     def answer(self, query: str) -> str:
         """Generate an answer using recursive chunk analysis."""
         depth = self._route_depth(query)
-        findings = self._recursive_search(query, depth=depth)
+        query_terms = frozenset(self._tokenize(query))
+        findings = self._recursive_search(query_terms, depth=depth)
         if not findings:
             return "I could not find relevant information in the local context."
         return self._synthesize_answer(query, findings)
 
     def _route_depth(self, query: str) -> int:
         """Decide how many recursive passes to run based on query complexity."""
-        tokens = re.findall(r"[A-Za-z0-9]+", query)
-        complexity = len(tokens) + sum(1 for token in tokens if len(token) > 6)
-        if re.search(r"why|how|compare|difference|justify", query, re.IGNORECASE):
-            complexity += 8
-        if complexity <= 12:
-            return 1
-        if complexity <= 24:
-            return 2
-        return 3
-
-    def _recursive_search(self, query: str, depth: int) -> List[ChunkFinding]:
+        return _route_depth(query)
+
+    def _recursive_search(self, query_terms: frozenset[str], depth: int) -> List[ChunkFinding]:
         """Run recursive searches over chunks, returning top findings."""
-        findings = self._search_chunks(query)
+        findings = self._search_chunks(query_terms)
         if depth <= 1 or not findings:
             return findings
         refined_findings: List[ChunkFinding] = []
         for finding in findings:
-            sub_query = self._refine_query(query, finding)
-            deeper_findings = self._search_chunks(sub_query, base_chunks=[finding.chunk])
+            sub_terms = self._refine_query(query_terms, finding)
+            deeper_findings = self._search_chunks(sub_terms, chunk_ids=[finding.chunk_id])
             refined_findings.extend(deeper_findings)
         return refined_findings or findings
 
     def _search_chunks(
-        self, query: str, base_chunks: Sequence[ContextChunk] | None = None
+        self, query_terms: frozenset[str], chunk_ids: Sequence[int] | None = None
     ) -> List[ChunkFinding]:
-        """Score chunks and collect top snippets that match the query."""
-        chunks = base_chunks if base_chunks is not None else self.context_chunks
-        query_terms = self._tokenize(query)
+        """Score chunks, then collect snippets for the top matches only."""
         findings: List[ChunkFinding] = []
-        for chunk in chunks:
-            score, snippets = self._score_chunk(chunk.text, query_terms)
-            if score <= 0:
-                continue
-            findings.append(ChunkFinding(chunk=chunk, score=score, snippets=snippets))
-        return sorted(findings, key=lambda item: item.score, reverse=True)[:6]
+        for cid, score in self._rank_chunks(query_terms, chunk_ids):
+            snippets = self._extract_snippets(self._texts[cid], query_terms)
+            findings.append(
+                ChunkFinding(
+                    chunk=self._chunk(cid), score=score, snippets=snippets, chunk_id=cid
+                )
+            )
+        return findings
+
+    def _rank_chunks(
+        self, query_terms: frozenset[str], chunk_ids: Sequence[int] | None = None
+    ) -> List[tuple[int, float]]:
+        """Return the top (chunk id, score) pairs that match, without touching chunk text."""
+        if not query_terms:
+            return []
+        if chunk_ids is not None:
+            scored = ((cid, self._score_chunk(cid, query_terms)) for cid in chunk_ids)
+            top = heapq.nlargest(6, scored, key=lambda item: item[1])
+        else:
+            top = self._score_postings(query_terms, limit=6)
+        return [(cid, score) for cid, score in top if score > 0]
+
+    def _chunk(self, cid: int) -> ContextChunk:
+        """Materialize the chunk stored under ``cid``."""
+        return ContextChunk(
+            source=self._sources[cid], index=self._indices[cid], text=self._texts[cid]
+        )
 
     def _tokenize(self, text: str) -> List[str]:
-        return [token.lower() for token in re.findall(r"[A-Za-z0-9]+", text)]
-
-    def _score_chunk(self, text: str, query_terms: List[str]) -> tuple[float, List[str]]:
-        lowered = text.lower()
-        hits = [term for term in query_terms if term in lowered]
-        if not hits:
-            return 0.0, []
-        term_density = len(hits) / max(len(query_terms), 1)
-        signal = term_density * math.log(len(text) + 10)
-        snippets = self._extract_snippets(text, hits)
-        return signal, snippets
-
-    def _extract_snippets(self, text: str, terms: List[str]) -> List[str]:
-        sentences = re.split(r"(?<=[.!?])\s+", text)
-        scored: List[tuple[float, str]] = []
-        for sentence in sentences:
-            lowered = sentence.lower()
-            score = sum(1 for term in terms if term in lowered)
+        return list(_tokenize_cached(text))
+
+    def _lookup_postings(
+        self, query_terms: frozenset[str]
+    ) -> List[tuple[array[int], array[float]]]:
+        """Resolve query terms against the vocabulary, dropping terms it does not contain."""
+        postings = self._postings
+        return [postings[term] for term in query_terms & postings.keys()]
+
+    def _score_postings(
+        self, query_terms: frozenset[str], limit: int
+    ) -> List[tuple[int, float]]:
+        """Return the ``limit`` best (chunk id, TF-IDF score) pairs from the postings."""
+        # Sparse accumulator: only chunks hit by a posting get a slot, so cost tracks hits.
+        scores: defaultdict[int, float] = defaultdict(float)
+        for cids, weights in self._lookup_postings(query_terms):
+            for cid, weight in zip(cids, weights):
+                scores[cid] += weight
+        # Ranking hits in chunk id order keeps ties deterministic.
+        best = heapq.nlargest(limit, sorted(scores), key=scores.__getitem__)
+        return [(cid, scores[cid]) for cid in best]
+
+    def _score_chunk(self, cid: int, query_terms: frozenset[str]) -> float:
+        """Return the TF-IDF score of a single chunk for the given query terms."""
+        row = self._rows[cid]
+        return sum(row[term] for term in query_terms & row.keys())
+
+    def _extract_snippets(self, text: str, terms: frozenset[str]) -> List[str]:
+        scored: List[tuple[int, int, int]] = []
+        for start, end, tokens in _index_sentences(text):
+            score = len(terms & tokens)
             if score:
-                scored.append((score, sentence.strip()))
-        scored.sort(key=lambda item: item[0], reverse=True)
-        return [snippet for _, snippet in scored[:3]]
+                scored.append((score, start, end))
+        # The cached index holds only offsets and token sets; just the winners become strings.
+        top = heapq.nlargest(3, scored, key=lambda item: item[0])
+        return [text[start:end].strip() for _, start, end in top]
 
-    def _refine_query(self, query: str, finding: ChunkFinding) -> str:
-        """Use a finding to shape a narrower sub-query."""
+    def _refine_query(
+        self, query_terms: frozenset[str], finding: ChunkFinding
+    ) -> frozenset[str]:
+        """Use a finding to shape a narrower sub-query from its snippets' terms."""
         if not finding.snippets:
-            return query
-        focus = " ".join(finding.snippets)
-        return f"{query} Focus on: {focus}"
+            return query_terms
+        return query_terms.union(*map(_tokenize_cached, finding.snippets))
 
     def _synthesize_answer(self, query: str, findings: Sequence[ChunkFinding]) -> str:
         """Combine recursive findings into a final response."""
@@ -185,13 +441,31 @@ def _parse_args() -> argparse.Namespace:
         default=DEFAULT_CONTEXT_FILES,
         help="Files to load into the RLM context.",
     )
+    parser.add_argument(
+        "--batch",
+        action="store_true",
+        help="Answer newline-separated questions from stdin instead of starting the REPL.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help=f"Rebuild the context index instead of reusing the copy in {DEFAULT_CACHE_DIR}.",
+    )
     return parser.parse_args()
 
 
 def main() -> None:
     args = _parse_args()
     context_files = [Path(path) for path in args.context]
-    bot = RLMChatBot(context_files=context_files)
+    cache_dir = None if args.no_cache else DEFAULT_CACHE_DIR
+    bot = RLMChatBot(context_files=context_files, cache_dir=cache_dir)
+
+    if args.batch:
+        for line in sys.stdin:
+            query = line.strip()
+            if query:
+                print(bot.answer(query), end="\n\n")
+        return
 
     print("RLM Chatbot ready. Ask a question, or type 'exit' to quit.")
     while True: